@@ -1,50 +1,46 @@
 # anomaly_model.py
-from dataclasses import dataclass, field
-from typing import Dict, List, Tuple, Optional
-import math
+from typing import Dict, List, Optional
 import time
 
+import numpy as np
+from numba import njit
+from scipy.optimize import linear_sum_assignment
+
 # --------------------------
 # Simple utilities
 # --------------------------
-def iou(boxA, boxB) -> float:
-    # boxes: (x1,y1,x2,y2)
-    xA = max(boxA[0], boxB[0])
-    yA = max(boxA[1], boxB[1])
-    xB = min(boxA[2], boxB[2])
-    yB = min(boxA[3], boxB[3])
-    inter = max(0, xB - xA) * max(0, yB - yA)
-    if inter <= 0:
-        return 0.0
-    areaA = (boxA[2]-boxA[0]) * (boxA[3]-boxA[1])
-    areaB = (boxB[2]-boxB[0]) * (boxB[3]-boxB[1])
-    return inter / float(areaA + areaB - inter + 1e-6)
-
-def center_of(box) -> Tuple[float, float]:
-    x1, y1, x2, y2 = box
-    return ( (x1 + x2) / 2.0, (y1 + y2) / 2.0 )
-
-def euclid(a: Tuple[float,float], b: Tuple[float,float]) -> float:
-    return math.hypot(a[0]-b[0], a[1]-b[1])
+@njit("f4[:,::1](f4[:,::1], f4[:,::1], i1[::1], i1[::1])", cache=True, fastmath=True)
+def class_iou_matrix(boxes_t, boxes_d, cls_t, cls_d):
+    # boxes: (Nt,4) and (Nd,4) of (x1,y1,x2,y2) -> (Nt,Nd) IoU, -1 where classes differ
+    # (eagerly compiled on import via the explicit signature)
+    nt, nd = boxes_t.shape[0], boxes_d.shape[0]
+    out = np.empty((nt, nd), dtype=np.float32)
+    for i in range(nt):
+        ax1, ay1, ax2, ay2 = boxes_t[i, 0], boxes_t[i, 1], boxes_t[i, 2], boxes_t[i, 3]
+        areaA = (ax2 - ax1) * (ay2 - ay1)
+        for j in range(nd):
+            if cls_t[i] != cls_d[j]:
+                out[i, j] = -1.0
+                continue
+            bx1, by1, bx2, by2 = boxes_d[j, 0], boxes_d[j, 1], boxes_d[j, 2], boxes_d[j, 3]
+            w = min(ax2, bx2) - max(ax1, bx1)
+            h = min(ay2, by2) - max(ay1, by1)
+            if w <= 0 or h <= 0:
+                out[i, j] = 0.0
+                continue
+            inter = w * h
+            areaB = (bx2 - bx1) * (by2 - by1)
+            out[i, j] = inter / (areaA + areaB - inter + 1e-6)
+    return out
 
-# --------------------------
-# Track entities
-# --------------------------
-@dataclass
-class Track:
-    id: int
-    cls: str
-    box: Tuple[float,float,float,float]
-    conf: float
-    first_time: float
-    last_time: float
-    first_center: Tuple[float,float] = field(default_factory=lambda:(0,0))
-    alerted: bool = False  # prevent duplicate alerts
-
-    def update(self, box, conf, t):
-        self.box = box
-        self.conf = conf
-        self.last_time = t
+def centers_of(boxes: np.ndarray) -> np.ndarray:
+    # boxes: (N,4) array of (x1,y1,x2,y2) -> (N,2) array of centers
+    return np.stack((boxes[:, 0::2].sum(1) * 0.5, boxes[:, 1::2].sum(1) * 0.5), axis=1)
+
+def dist2(a, b):
+    # squared euclidean distance over the last axis (broadcasts); no sqrt
+    d = np.subtract(a, b)
+    return (d * d).sum(-1)
 
 # --------------------------
 # Main anomaly detector
@@ -55,8 +51,9 @@ class AnomalyDetector:
       - Loitering: person stays within small radius for > LOITER_TIME_S
       - Abandoned object: handbag has no nearby person for > ABANDON_TIME_S
     Notes:
-      * Works on YOLOv8 results (boxes.xyxy, cls names).
+      * Works on YOLOv8 results (boxes.xyxy/cls/conf arrays + model.names).
       * Designed for single camera per process (keeps in-memory tracks).
+      * Tracks are stored as parallel NumPy columns (row i = one track).
     """
     # Tunables (you can tweak)
     MATCH_IOU_THR = 0.3
@@ -65,119 +62,155 @@ class AnomalyDetector:
     ABANDON_TIME_S = 20.0
     NEAR_PERSON_DIST_PX = 80.0
     MAX_TRACK_AGE_S = 5.0  # drop tracks if not seen recently
+    # squared radii so distance checks can skip the sqrt
+    LOITER_RADIUS_PX2 = LOITER_RADIUS_PX ** 2
+    NEAR_PERSON_DIST_PX2 = NEAR_PERSON_DIST_PX ** 2
 
     PERSON_LABELS = {"person"}
     OBJECT_LABELS = {"handbag", "backpack", "suitcase"}  # extend as needed
 
-    def __init__(self):
+    def __init__(self, names: Dict[int, str]):
+        # names: class id -> class name, e.g. YOLO(...).names
+        self.names = dict(names)
+        # cls_id is stored as int8 (also the numba kernel's signature)
+        if self.names and max(self.names) > np.iinfo(np.int8).max:
+            raise ValueError(
+                f"class ids above {np.iinfo(np.int8).max} are not supported "
+                f"(got {max(self.names)})")
+        # cls_id -> is-person / is-object lookup tables (int8 ids index directly)
+        self._is_person = self._class_table(self.PERSON_LABELS)
+        self._is_object = self._class_table(self.OBJECT_LABELS)
         self.next_id = 1
-        self.tracks: Dict[int, Track] = {}
+        # track columns
+        self.ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.confs = np.empty(0, dtype=np.float32)
+        self.centers = np.empty((0, 2), dtype=np.float32)  # kept in sync with boxes
+        self.first_center = np.empty((0, 2), dtype=np.float32)
+        self.first_time = np.empty(0, dtype=np.float64)
+        self.last_time = np.empty(0, dtype=np.float64)
+        self.cls_id = np.empty(0, dtype=np.int8)
+        self.alerted = np.empty(0, dtype=bool)  # prevent duplicate alerts
+
+    _COLUMNS = ("ids", "boxes", "confs", "centers", "first_center",
+                "first_time", "last_time", "cls_id", "alerted")
 
     # --------------- public API ---------------
-    def step(self, detections: List[Tuple[str, float, Tuple[float,float,float,float]]],
+    def step(self, boxes: np.ndarray, cls_ids: np.ndarray, confs: np.ndarray,
              now_s: Optional[float] = None) -> List[dict]:
         """
-        detections: list of (cls_name, conf, (x1,y1,x2,y2))
+        boxes: (N,4) float32 array of (x1,y1,x2,y2)
+        cls_ids: (N,) int8 array of class ids (keys of `names`)
+        confs: (N,) float32 array of confidences
         returns: list of alerts dicts
         """
         t = time.time() if now_s is None else now_s
-        self._associate(detections, t)
+        # with no detections there is nothing to match; existing tracks still age
+        if len(boxes):
+            self._associate(boxes, cls_ids, confs, t)
+        elif len(self.ids) == 0:
+            return []  # nothing detected, nothing tracked (e.g. empty scene)
         self._purge_stale(t)
-        alerts = []
-        alerts += self._check_loitering(t)
-        alerts += self._check_abandoned(t)
+        person = self._is_person[self.cls_id]  # shared by both checks
+        alerts = self._check_loitering(t, person)
+        alerts.extend(self._check_abandoned(t, person))
         return alerts
 
+    # --------------- track storage ---------------
+    def _class_table(self, labels) -> np.ndarray:
+        table = np.zeros(np.iinfo(np.int8).max + 1, dtype=bool)
+        table[[i for i, n in self.names.items() if n in labels]] = True
+        return table
+
+    def _append(self, boxes, confs, cls_id, t):
+        n = len(boxes)
+        if n == 0:
+            return
+        ids = np.arange(self.next_id, self.next_id + n, dtype=np.int64)
+        self.next_id += n
+        self.ids = np.concatenate((self.ids, ids))
+        self.boxes = np.concatenate((self.boxes, boxes))
+        self.confs = np.concatenate((self.confs, confs))
+        centers = centers_of(boxes)
+        self.centers = np.concatenate((self.centers, centers))
+        self.first_center = np.concatenate((self.first_center, centers))
+        self.first_time = np.concatenate((self.first_time, np.full(n, t)))
+        self.last_time = np.concatenate((self.last_time, np.full(n, t)))
+        self.cls_id = np.concatenate((self.cls_id, cls_id))
+        self.alerted = np.concatenate((self.alerted, np.zeros(n, dtype=bool)))
+
+    def _compact(self, keep: np.ndarray):
+        # keep: boolean row mask applied to every column
+        for name in self._COLUMNS:
+            setattr(self, name, getattr(self, name)[keep])
+
     # --------------- internals ---------------
-    def _associate(self, dets, t):
-        # Greedy IoU matching to existing tracks
-        unmatched = set(range(len(dets)))
-        # try matching per class for stability
-        for tid, tr in list(self.tracks.items()):
-            best_j, best_score = -1, 0.0
-            for j in unmatched:
-                cls, conf, box = dets[j]
-                if cls != tr.cls:
-                    continue
-                score = iou(tr.box, box)
-                if score > best_score:
-                    best_score, best_j = score, j
-            if best_j != -1 and best_score >= self.MATCH_IOU_THR:
-                # update
-                cls, conf, box = dets[best_j]
-                tr.update(box, conf, t)
-                if tr.first_center == (0,0):
-                    tr.first_center = center_of(box)
-                unmatched.remove(best_j)
+    def _associate(self, boxes, cls_ids, confs, t):
+        D = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        d_cls = np.ascontiguousarray(cls_ids, dtype=np.int8)
+        d_conf = np.asarray(confs, dtype=np.float32)
+        unmatched = np.ones(len(D), dtype=bool)
+
+        # Optimal (Hungarian) IoU matching to existing tracks
+        if len(self.ids) and len(D):
+            # only match within the same class for stability (-1 IoU otherwise)
+            iou_mat = class_iou_matrix(self.boxes, D, self.cls_id, d_cls)
+            row_ind, col_ind = linear_sum_assignment(-iou_mat)
+            ok = iou_mat[row_ind, col_ind] >= self.MATCH_IOU_THR
+            rows, cols = row_ind[ok], col_ind[ok]
+            # update
+            self.boxes[rows] = D[cols]
+            self.confs[rows] = d_conf[cols]
+            self.centers[rows] = centers_of(D[cols])
+            self.last_time[rows] = t
+            unset = (self.first_center[rows] == 0).all(axis=1)
+            self.first_center[rows[unset]] = self.centers[rows[unset]]
+            unmatched[cols] = False
 
         # create tracks for the rest
-        for j in unmatched:
-            cls, conf, box = dets[j]
-            tid = self.next_id
-            self.next_id += 1
-            c = center_of(box)
-            self.tracks[tid] = Track(
-                id=tid, cls=cls, box=box, conf=conf,
-                first_time=t, last_time=t, first_center=c
-            )
+        self._append(D[unmatched], d_conf[unmatched], d_cls[unmatched], t)
 
     def _purge_stale(self, t):
-        stale = [tid for tid, tr in self.tracks.items()
-                 if (t - tr.last_time) > self.MAX_TRACK_AGE_S]
-        for tid in stale:
-            del self.tracks[tid]
-
-    def _check_loitering(self, t) -> List[dict]:
-        alerts = []
-        for tr in self.tracks.values():
-            if tr.alerted:
-                continue
-            if tr.cls not in self.PERSON_LABELS:
-                continue
-            dur = t - tr.first_time
-            if dur < self.LOITER_TIME_S:
-                continue
-            # has the person mostly stayed nearby?
-            cur_center = center_of(tr.box)
-            disp = euclid(cur_center, tr.first_center)
-            if disp <= self.LOITER_RADIUS_PX:
-                tr.alerted = True
-                alerts.append({
-                    "type": "loitering",
-                    "track_id": tr.id,
-                    "since_s": round(dur, 1),
-                    "box": tr.box,
-                    "conf": tr.conf
-                })
-        return alerts
+        keep = (t - self.last_time) <= self.MAX_TRACK_AGE_S
+        # most frames drop nothing; skip copying every column in that case
+        if not keep.all():
+            self._compact(keep)
 
-    def _check_abandoned(self, t) -> List[dict]:
-        alerts = []
+    def _check_loitering(self, t, person) -> List[dict]:
+        dur = t - self.first_time
+        # has the person mostly stayed nearby?
+        disp2 = dist2(self.centers, self.first_center)
+        hits = (~self.alerted & person & (dur >= self.LOITER_TIME_S)
+                & (disp2 <= self.LOITER_RADIUS_PX2))
+        self.alerted |= hits
+        return [{
+            "type": "loitering",
+            "track_id": int(self.ids[i]),
+            "since_s": round(float(dur[i]), 1),
+            "box": tuple(map(float, self.boxes[i])),
+            "conf": float(self.confs[i])
+        } for i in np.flatnonzero(hits)]
+
+    def _check_abandoned(self, t, person) -> List[dict]:
         # Build a quick list of current person centers
-        people = [center_of(tr.box) for tr in self.tracks.values()
-                  if tr.cls in self.PERSON_LABELS and (t - tr.last_time) < 1.0]
-        for tr in self.tracks.values():
-            if tr.alerted:
-                continue
-            if tr.cls not in self.OBJECT_LABELS:
-                continue
-            # Is any person near the object?
-            c = center_of(tr.box)
-            near = any(euclid(c, pc) <= self.NEAR_PERSON_DIST_PX for pc in people)
-            if near:
-                # reset first_time so timer restarts while a person is close
-                tr.first_time = t if tr.first_center == (0,0) else tr.first_time
-                continue
-            # nobody near -> consider timer
-            dur = t - tr.first_time
-            if dur >= self.ABANDON_TIME_S:
-                tr.alerted = True
-                alerts.append({
-                    "type": "abandoned_object",
-                    "track_id": tr.id,
-                    "since_s": round(dur, 1),
-                    "box": tr.box,
-                    "conf": tr.conf,
-                    "label": tr.cls
-                })
-        return alerts
+        people = self.centers[person & ((t - self.last_time) < 1.0)]
+        objects = np.flatnonzero(~self.alerted & self._is_object[self.cls_id])
+        # Is any person near each object?
+        d2 = dist2(self.centers[objects, None, :], people[None, :, :])
+        near = (d2 <= self.NEAR_PERSON_DIST_PX2).any(axis=1)
+        # reset first_time so timer restarts while a person is close
+        reset = objects[near & (self.first_center[objects] == 0).all(axis=1)]
+        self.first_time[reset] = t
+        # nobody near -> consider timer
+        alone = objects[~near]
+        dur = t - self.first_time
+        hits = alone[dur[alone] >= self.ABANDON_TIME_S]
+        self.alerted[hits] = True
+        return [{
+            "type": "abandoned_object",
+            "track_id": int(self.ids[i]),
+            "since_s": round(float(dur[i]), 1),
+            "box": tuple(map(float, self.boxes[i])),
+            "conf": float(self.confs[i]),
+            "label": self.names[int(self.cls_id[i])]
+        } for i in hits]
@@ -1,12 +1,35 @@
 import streamlit as st
 import os
 import datetime
-import glob
 import pandas as pd
 
 # ----------------- Dashboard Layout -----------------
 st.set_page_config(page_title="AI Powered Surveillance System", layout="wide")
 
+# ----------------- Cached Data Access -----------------
+ALERT_DIR = "outputs"
+CSV_PATH = os.path.join(ALERT_DIR, "alerts.csv")
+
+def mtime_of(path):
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+# `mtime` only keys the cache, so reruns reuse the last scan until the
+# directory / log file actually changes
+@st.cache_data(ttl=2.0)
+def list_alerts(mtime):
+    # snapshot file names, newest first (scandir: no per-file stat)
+    if not os.path.isdir(ALERT_DIR):
+        return []
+    with os.scandir(ALERT_DIR) as it:
+        names = [e.name for e in it
+                 if e.name.startswith("alert_") and e.name.endswith(".jpg")]
+    names.sort(reverse=True)
+    return names
+
+@st.cache_data(max_entries=1)
+def load_alerts(mtime):
+    return pd.read_csv(CSV_PATH)
+
 # Sidebar for navigation
 menu = st.sidebar.radio("📌 Navigation", ["Overview", "Live Feed", "Alert History", "System Info"])
 
@@ -85,11 +108,11 @@ elif menu == "Live Feed":
     st.write("Timestamp:", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
     # Get the latest saved alert image
-    alert_images = sorted(glob.glob("outputs/alert_*.jpg"), reverse=True)
+    alert_names = list_alerts(mtime_of(ALERT_DIR))
 
-    if alert_images:
-        latest_image = alert_images[0]
-        st.image(latest_image, caption=f"Latest Alert: {os.path.basename(latest_image)}", use_container_width=True)
+    if alert_names:
+        latest_name = alert_names[0]
+        st.image(os.path.join(ALERT_DIR, latest_name), caption=f"Latest Alert: {latest_name}", use_container_width=True)
     else:
         st.warning("⚠️ No alert image found yet.")
 
@@ -97,27 +120,25 @@ elif menu == "Live Feed":
 elif menu == "Alert History":
     st.subheader("📂 Past Alerts")
 
-    alert_images = sorted(glob.glob("outputs/alert_*.jpg"), reverse=True)
+    alert_names = list_alerts(mtime_of(ALERT_DIR))
 
-    if alert_images:
+    if alert_names:
+        alert_images = [os.path.join(ALERT_DIR, name) for name in alert_names]
         cols = st.columns(3)
-        for i, img in enumerate(alert_images[:12]):  # Show last 12 alerts
+        for i, (img, name) in enumerate(zip(alert_images[:12], alert_names)):  # Show last 12 alerts
             with cols[i % 3]:
-                st.image(img, caption=os.path.basename(img), use_container_width=True)
+                st.image(img, caption=name, use_container_width=True)
 
-        # Table view
-        timestamps = [
-            os.path.basename(img).replace("alert_", "").replace(".jpg", "") for img in alert_images
-        ]
+        # Table view ("alert_<date>_<time>_<sub>[_<pid>].jpg"); drop the pid
+        timestamps = ["_".join(name[6:-4].split("_")[:3]) for name in alert_names]
         df = pd.DataFrame({"Alert Image": alert_images, "Timestamp": timestamps})
         st.dataframe(df, use_container_width=True)
     else:
         st.info("No past alerts recorded.")
 
     # CSV log view
-    csv_path = "outputs/alerts.csv"
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
+    if os.path.exists(CSV_PATH):
+        df = load_alerts(mtime_of(CSV_PATH))
         anomaly_filter = st.selectbox(
             "Filter by anomaly type", ["All", "loitering", "abandoned_object"]
         )
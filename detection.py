@@ -1,95 +1,209 @@
 # detection.py
 import os
 import csv
-from datetime import datetime
-from typing import List, Tuple
+import time
+import atexit
+import queue
+import threading
 
 import cv2
+import numpy as np
+import torch
 from ultralytics import YOLO
 
 from anomaly_model import AnomalyDetector
 
 # -------- setup --------
-model = YOLO("yolov8n.pt")  # ensure weights exist
-detector = AnomalyDetector()
+# a TensorRT export (yolo export model=yolov8n.pt format=engine half=True)
+# can be dropped in via YOLO_WEIGHTS=yolov8n.engine
+WEIGHTS = os.environ.get("YOLO_WEIGHTS", "yolov8n.pt")
+model = YOLO(WEIGHTS)  # ensure weights exist
+DEVICE = 0 if torch.cuda.is_available() else "cpu"
+detector = AnomalyDetector(model.names)
 
 ALERT_DIR = "outputs"
 ALERT_CSV = os.path.join(ALERT_DIR, "alerts.csv")
 os.makedirs(ALERT_DIR, exist_ok=True)
 
+# one long-lived handle for the alert log; rows are written through (flushed)
+# on every alerting frame, so only the per-frame open/close is saved
+_new_csv = not os.path.exists(ALERT_CSV)
+_csv_fh = open(ALERT_CSV, "a", newline="")
+_csv_w = csv.writer(_csv_fh)
+atexit.register(_csv_fh.close)
+
 # CSV header if not exists
-if not os.path.exists(ALERT_CSV):
-    with open(ALERT_CSV, "w", newline="") as f:
-        w = csv.writer(f)
-        w.writerow(["timestamp", "type", "label", "track_id", "since_s", "image"])
+if _new_csv:
+    _csv_w.writerow(["timestamp", "type", "label", "track_id", "since_s", "image"])
 
 COCO_ALLOWED = {"person", "handbag", "backpack", "suitcase"}  # speed-up
-
-def to_xyxy(bxyxy) -> Tuple[float,float,float,float]:
-    return float(bxyxy[0]), float(bxyxy[1]), float(bxyxy[2]), float(bxyxy[3])
-
-def detect_objects(video_path: str, display: bool = True):
+# class filtering happens inside YOLO's NMS rather than on the Python side
+ALLOWED_IDS = [i for i, n in model.names.items() if n in COCO_ALLOWED]
+# FP16 halves memory traffic on GPU; CPU inference stays FP32
+PREDICT_ARGS = dict(device=DEVICE, half=DEVICE != "cpu", classes=ALLOWED_IDS,
+                    conf=0.25, verbose=False)
+PREFETCH = 8  # frames buffered between pipeline stages
+BATCH = 8  # frames per YOLO forward pass when not displaying (.pt weights only)
+SNAPSHOT_QUEUE = 32  # alert snapshots waiting for the JPEG writer
+JPEG_QUALITY = 85
+
+def _read_frames(cap, read_q: queue.Queue, stop: threading.Event):
+    # decode stage: push frames until the video ends or the consumer stops;
+    # a decode error is handed to the consumer to re-raise
+    end = None
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            read_q.put(frame)
+    except Exception as e:
+        end = e
+    finally:
+        read_q.put(end)
+
+def _save_snapshot(img_path: str, image):
+    try:
+        cv2.imwrite(img_path, image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    except Exception as e:
+        # log and move on so one bad write never stalls the pipeline
+        print(f"⚠️ Failed to save snapshot {img_path}: {e}")
+
+def _write_images(write_q: queue.Queue):
+    # encode stage: save alert snapshots until the None sentinel arrives
+    while True:
+        item = write_q.get()
+        if item is None:
+            break
+        _save_snapshot(*item)
+
+# alert timestamps: strftime once per second plus a per-second counter keeps
+# the "YYYYmmdd_HHMMSS_NNNNNN" shape and never collides within a burst
+_ts_sec = -1
+_ts_prefix = ""
+_ts_count = 0
+# snapshot names also carry the pid: several camera processes share ALERT_DIR
+_PID = os.getpid()
+
+def _alert_timestamp() -> str:
+    global _ts_sec, _ts_prefix, _ts_count
+    sec = int(time.time())
+    if sec != _ts_sec:
+        _ts_sec, _ts_count = sec, 0
+        _ts_prefix = time.strftime("%Y%m%d_%H%M%S", time.localtime(sec))
+    ts = f"{_ts_prefix}_{_ts_count:06d}"
+    _ts_count += 1
+    return ts
+
+def _log_alerts(rows):
+    # alerting frames are rare: flush each one so the dashboard sees the row
+    # as soon as its snapshot lands
+    _csv_w.writerows(rows)
+    _csv_fh.flush()
+
+def _handle_result(r, write_q: queue.Queue, draw_all: bool = False):
+    # per-frame work on one YOLO result: track, annotate, save & log alerts
+
+    # Detections stay as arrays (already limited to ALLOWED_IDS); one
+    # device->host copy per tensor instead of one per box
+    boxes = r.boxes.xyxy.cpu().numpy().astype(np.float32)
+    cls_ids = r.boxes.cls.cpu().numpy().astype(np.int8)
+    confs = r.boxes.conf.cpu().numpy().astype(np.float32)
+
+    # Anomaly step
+    alerts = detector.step(boxes, cls_ids, confs)
+
+    # Annotate frame: the full YOLO overlay only on request, otherwise just
+    # the alert boxes drawn straight onto the frame (nothing else reuses it)
+    annotated = r.plot() if draw_all else r.orig_img
+    for a in alerts:
+        x1,y1,x2,y2 = map(int, a["box"])
+        cv2.rectangle(annotated, (x1,y1), (x2,y2), (0,0,255), 2)
+        cv2.putText(annotated, f'{a["type"]}', (x1, max(20, y1-8)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2)
+
+    # Save & log if any alert
+    if alerts:
+        ts = _alert_timestamp()
+        img_path = os.path.join(ALERT_DIR, f"alert_{ts}_{_PID}.jpg")
+        try:
+            write_q.put_nowait((img_path, annotated))
+        except queue.Full:
+            # writer is behind on a burst: encode here instead of waiting
+            _save_snapshot(img_path, annotated)
+
+        _log_alerts([
+            [
+                ts,
+                a["type"],
+                a.get("label", "person"),
+                a["track_id"],
+                a["since_s"],
+                os.path.basename(img_path),
+            ]
+            for a in alerts
+        ])
+        print(f"🚨 {len(alerts)} alert(s) logged -> {img_path}")
+
+    return annotated
+
+def detect_objects(video_path: str, display: bool = True, draw_all: bool = False):
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise RuntimeError(f"Cannot open video: {video_path}")
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # YOLO inference
-        results = model(frame, verbose=False)
-        r = results[0]
-
-        # Build detection list (cls_name, conf, (x1,y1,x2,y2))
-        dets = []
-        for b in r.boxes:
-            cls_idx = int(b.cls)
-            cls_name = r.names[cls_idx]
-            if cls_name not in COCO_ALLOWED:
-                continue
-            conf = float(b.conf)
-            box = to_xyxy(b.xyxy[0].tolist())
-            dets.append((cls_name, conf, box))
-
-        # Anomaly step
-        alerts = detector.step(dets)
-
-        # Annotate frame
-        annotated = r.plot()
-        for a in alerts:
-            x1,y1,x2,y2 = map(int, a["box"])
-            cv2.rectangle(annotated, (x1,y1), (x2,y2), (0,0,255), 2)
-            cv2.putText(annotated, f'{a["type"]}', (x1, max(20, y1-8)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2)
-
-        # Save & log if any alert
-        if alerts:
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            img_path = os.path.join(ALERT_DIR, f"alert_{ts}.jpg")
-            cv2.imwrite(img_path, annotated)
-
-            with open(ALERT_CSV, "a", newline="") as f:
-                w = csv.writer(f)
-                for a in alerts:
-                    w.writerow([
-                        ts,
-                        a["type"],
-                        a.get("label", "person"),
-                        a["track_id"],
-                        a["since_s"],
-                        os.path.basename(img_path),
-                    ])
-            print(f"🚨 {len(alerts)} alert(s) logged -> {img_path}")
-
-        if display:
-            cv2.imshow("Detection", annotated)
-            if cv2.waitKey(1) & 0xFF == ord("q"):
+    # decode -> infer -> encode pipeline; inference, the detector and the
+    # display window all stay on this thread (OpenCV GUI needs the main thread)
+    read_q = queue.Queue(maxsize=PREFETCH)
+    write_q = queue.Queue(maxsize=SNAPSHOT_QUEUE)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_frames, args=(cap, read_q, stop), daemon=True)
+    writer = threading.Thread(target=_write_images, args=(write_q,), daemon=True)
+    reader.start()
+    writer.start()
+
+    # batch frames through YOLO when nobody is watching; the detector still
+    # steps frame by frame in order. Exported backends (e.g. a static batch-1
+    # TensorRT engine) require a fixed input shape, so they stay at 1.
+    batch_size = BATCH if not display and WEIGHTS.endswith(".pt") else 1
+    try:
+        done = False
+        while not done:
+            frames = []
+            while len(frames) < batch_size:
+                frame = read_q.get()
+                if isinstance(frame, Exception):
+                    raise frame
+                if frame is None:
+                    done = True
+                    break
+                frames.append(frame)
+            if not frames:
                 break
 
-    cap.release()
-    cv2.destroyAllWindows()
+            # YOLO inference
+            results = model(frames, **PREDICT_ARGS)
+
+            for r in results:
+                annotated = _handle_result(r, write_q, draw_all)
+                if display:
+                    cv2.imshow("Detection", annotated)
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        done = True
+                        break
+    finally:
+        # unblock the reader if we stopped early, then flush pending snapshots
+        stop.set()
+        while reader.is_alive():
+            try:
+                read_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        if writer.is_alive():
+            write_q.put(None)
+            writer.join()
+        cap.release()
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     detect_objects("data/testing_videos/01.avi", display=True)